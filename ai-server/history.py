@@ -0,0 +1,68 @@
+# history.py
+# 공간별 최근 특징값 기록 (float32 링 버퍼)
+
+import numpy as np
+
+
+class FeatureHistoryStore:
+    """
+    spaceId마다 고정 크기 float32 링 버퍼를 미리 잡아두고 최근 특징 행을 기록한다.
+
+    - 컬럼 순서는 생성 시 넘긴 columns(top_features)와 같다.
+    - timestamp는 float32로는 초 단위 정밀도가 안 나오므로 별도 float64 링 버퍼에 저장한다.
+    - 공간당 메모리는 capacity로 고정, 기록(scratch_row → append)은 새 배열을 만들지 않는다.
+    """
+
+    def __init__(self, columns, capacity=256):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+
+        self.columns = list(columns)
+        self.capacity = capacity
+        self._values = {}       # spaceId -> (capacity, len(columns)) float32
+        self._timestamps = {}   # spaceId -> (capacity,) float64
+        self._next = {}         # spaceId -> 다음에 쓸 위치
+        self._count = {}        # spaceId -> 저장된 행 수 (최대 capacity)
+        # 특징 계산 중에는 여기에 채우고, 끝까지 성공했을 때만 append로 링 버퍼에 복사.
+        # 모델 입력으로도 쓰이므로 float64로 두고, 링 버퍼에 복사할 때만 float32로 줄인다.
+        self._scratch = np.zeros(len(self.columns), dtype=np.float64)
+
+    def _ensure(self, space_id):
+        if space_id not in self._values:
+            self._values[space_id] = np.zeros((self.capacity, len(self.columns)), dtype=np.float32)
+            self._timestamps[space_id] = np.zeros(self.capacity, dtype=np.float64)
+            self._next[space_id] = 0
+            self._count[space_id] = 0
+
+    def scratch_row(self):
+        """
+        특징값을 채울 임시 행 (store 하나당 하나를 재사용).
+        채우다 실패해도 링 버퍼에는 영향이 없고, append()로 넘겨야 기록된다.
+        """
+        return self._scratch
+
+    def append(self, space_id, values, timestamp):
+        """columns 순서의 값 시퀀스를 한 행으로 기록 (float32로 변환되어 저장)"""
+        self._ensure(space_id)
+        pos = self._next[space_id]
+        self._values[space_id][pos] = values
+        self._timestamps[space_id][pos] = timestamp
+        self._next[space_id] = (pos + 1) % self.capacity
+        self._count[space_id] = min(self._count[space_id] + 1, self.capacity)
+
+    def window(self, space_id, limit=None):
+        """
+        최근 limit개 행을 오래된 순으로 반환 (timestamps, values 복사본).
+        기록이 없으면 길이 0 배열을 반환.
+        """
+        count = self._count.get(space_id, 0)
+        if limit is not None:
+            count = max(0, min(count, limit))
+        if count == 0:
+            return (
+                np.empty(0, dtype=np.float64),
+                np.empty((0, len(self.columns)), dtype=np.float32),
+            )
+
+        idx = (self._next[space_id] - count + np.arange(count)) % self.capacity
+        return self._timestamps[space_id][idx], self._values[space_id][idx]
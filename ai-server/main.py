@@ -1,11 +1,17 @@
 import os
 import json
 import math
-from typing import List, Dict, Any, Optional
+import mmap
+import time
+import struct
+import asyncio
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Set
 
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
-from reco import recommend_rooms
+from reco import RankingSession, recommend_rooms
+from history import FeatureHistoryStore
 
 from dotenv import load_dotenv
 from google import genai
@@ -27,6 +33,15 @@ print("Loaded MY_GEMINI_API_KEY:", MY_GEMINI_API_KEY)
 
 if not MY_GEMINI_API_KEY:
     raise ValueError("❌ MY_GEMINI_API_KEY is missing. Check your .env file!")
+
+# Gemini 배치 윈도우 (ms). 0이면 배치 없이 요청마다 바로 호출한다.
+GEMINI_BATCH_WINDOW_MS = float(os.getenv("GEMINI_BATCH_WINDOW_MS", "0"))
+# 한 번의 배치 호출에 담을 최대 userText 개수 (초과 시 윈도우 전에 바로 전송)
+GEMINI_BATCH_MAX_SIZE = int(os.getenv("GEMINI_BATCH_MAX_SIZE", "16"))
+# userId별로 유지할 추천 랭킹 세션 최대 개수 (초과 시 오래된 것부터 제거)
+RANKING_SESSION_MAX = int(os.getenv("RANKING_SESSION_MAX", "1024"))
+# spaceId별로 보관할 최근 특징 행 개수
+FEATURE_HISTORY_SIZE = int(os.getenv("FEATURE_HISTORY_SIZE", "256"))
 # -----------------------------------------------------
 
 app = FastAPI(title="AI Space Recommendation API")
@@ -40,6 +55,10 @@ top_features = [
     'numberOfHuman', 'speech_noise_ratio', 'mfcc_3_mean',
     'mfcc_14_mean', 'mfcc_8_mean', 'centroid', 'bleNum'
 ]
+FEATURE_INDEX = {f: i for i, f in enumerate(top_features)}
+
+# spaceId별 최근 특징 기록 (top_features 순서의 float32 행 + timestamp)
+feature_history = FeatureHistoryStore(top_features, FEATURE_HISTORY_SIZE)
 
 # 사람 수 감지 함수
 def count_people(image_path):
@@ -74,98 +93,141 @@ def band_energy(signal, sr, low, high):
 
 
 # -----------------------------
-# 2. SPL 계산
+# 2. MFCC 평균
 # -----------------------------
-def calc_spl(signal):
-    rms = np.sqrt(np.mean(signal ** 2))
-    return 20 * np.log10(rms + 1e-7)
+def extract_mfcc_mean(signal, sr, n_mfcc=20):
+    mfcc = librosa.feature.mfcc(y=signal, sr=sr, n_mfcc=n_mfcc)
+    return mfcc.mean(axis=1)
 
 
 # -----------------------------
-# 3. MFCC + 잡음 보정
+# 3. 오디오 로드 (PCM16 WAV 고속 경로)
 # -----------------------------
-def extract_mfcc(signal, sr, n_mfcc=20):
-    mfcc = librosa.feature.mfcc(y=signal, sr=sr, n_mfcc=n_mfcc)
-    return mfcc.mean(axis=1), mfcc.var(axis=1)
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
 
 
-# -----------------------------
-# 4. 전체 오디오 특징 추출
-# -----------------------------
-def extract_audio_features(path=r"C:\realthon_t6\vid1.wav", n_mfcc=20):
-    signal, sr = librosa.load(path, sr=None)
+def read_pcm16_wav(path):
+    """
+    센서가 만드는 16bit PCM WAV를 mmap으로 읽어 (mono float32 signal, sr) 반환.
+    librosa.load(path, sr=None)와 같은 방식(채널 평균, /32768 정규화)으로 변환한다.
+    PCM16 WAV가 아니거나 읽을 샘플이 없으면 None 반환 (librosa로 fallback).
+    """
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
 
-    # 1) SPL
-    spl = calc_spl(signal)
+    try:
+        if len(mm) < 12 or mm[0:4] != b"RIFF" or mm[8:12] != b"WAVE":
+            return None
+
+        fmt = None
+        data_offset = data_size = None
+        pos = 12
+        while pos + 8 <= len(mm):
+            chunk_id = mm[pos:pos + 4]
+            chunk_size = struct.unpack_from("<I", mm, pos + 4)[0]
+            body = pos + 8
+            if chunk_id == b"fmt " and chunk_size >= 16:
+                fmt = struct.unpack_from("<HHIIHH", mm, body)
+                if fmt[0] == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                    # WAVEFORMATEXTENSIBLE: SubFormat GUID 앞 2바이트가 실제 포맷 코드
+                    sub_format = struct.unpack_from("<H", mm, body + 24)[0]
+                    fmt = (sub_format,) + fmt[1:]
+            elif chunk_id == b"data":
+                data_offset = body
+                # 스트리밍으로 쓰다 닫히지 않은 파일은 size가 0 / 0xFFFFFFFF 이거나
+                # 파일보다 클 수 있음 -> 파일 끝까지를 data로 본다
+                if chunk_size in (0, 0xFFFFFFFF):
+                    chunk_size = len(mm) - body
+                data_size = min(chunk_size, len(mm) - body)
+                break
+            pos = body + chunk_size + (chunk_size & 1)
+
+        if fmt is None or data_offset is None:
+            return None
+
+        audio_format, channels, sr, _, _, bits = fmt
+        if audio_format != WAVE_FORMAT_PCM or bits != 16 or channels < 1:
+            return None
+
+        frames = data_size // (2 * channels)
+        if frames == 0:
+            return None
+        samples = np.frombuffer(mm, dtype="<i2", count=frames * channels, offset=data_offset)
+
+        # 다운믹스 + float32 변환 + 정규화를 한 번에 (중간 float64 버퍼 없음)
+        if channels == 1:
+            signal = np.multiply(samples, np.float32(1.0 / 32768.0), dtype=np.float32)
+        else:
+            weights = np.full(channels, 1.0 / (32768.0 * channels), dtype=np.float32)
+            signal = samples.reshape(frames, channels) @ weights
+
+        # mmap을 닫기 전에 버퍼 뷰를 해제해야 함
+        del samples
+        return signal, sr
+    finally:
+        mm.close()
+
+
+def load_audio(path):
+    """PCM16 WAV는 고속 경로로, 그 외 포맷은 librosa로 로드 (원본 샘플레이트 유지)"""
+    try:
+        loaded = read_pcm16_wav(path)
+    except (OSError, ValueError, struct.error):
+        loaded = None
 
-    # 2) MFCC mean + var
-    mfcc_mean, mfcc_var = extract_mfcc(signal, sr, n_mfcc=n_mfcc)
+    if loaded is None:
+        return librosa.load(path, sr=None)
+    return loaded
 
-    # 3) ZCR
-    zcr = librosa.feature.zero_crossing_rate(y=signal).mean()
 
-    # 4) Centroid
-    centroid = librosa.feature.spectral_centroid(y=signal, sr=sr).mean()
+# -----------------------------
+# 4. 모델 입력 특징 추출
+# -----------------------------
+def build_feature_row(out, img_path, ble_raw, audio_path, n_mfcc=20):
+    """top_features 순서의 행(out)에 특징값을 바로 채운다 (feature dict 생성 없음)"""
+    signal, sr = load_audio(audio_path)
 
-    # 5) Band energies
+    mfcc_mean = extract_mfcc_mean(signal, sr, n_mfcc=n_mfcc)
     band0_300 = band_energy(signal, sr, 0, 300)
     band300_3000 = band_energy(signal, sr, 300, 3000)
-    band3000_8000 = band_energy(signal, sr, 3000, 8000)
-
-    band_ratio_speech = band300_3000 / (band0_300 + 1e-7)
-
-    # 모든 feature 평탄화해서 하나의 벡터로 합침
-    features = {
-        "spl": spl,
-        "zcr": zcr,
-        "centroid": centroid,
-        "band0_300": band0_300,
-        "band300_3000": band300_3000,
-        "band3000_8000": band3000_8000,
-        "speech_noise_ratio": band_ratio_speech,
-    }
-
-    # MFCC 추가
-    for i, v in enumerate(mfcc_mean):
-        features[f"mfcc_{i}_mean"] = v
-    for i, v in enumerate(mfcc_var):
-        features[f"mfcc_{i}_var"] = v
-
-    return features 
-
-def build_features(img_path, ble_raw, audio_path):
-    img_count = count_people(img_path)
-    ble_feats = ble_raw
-    audio_feats = extract_audio_features(audio_path)
-
-    row = {
-        "numberOfHuman": img_count,
-        "bleNum": ble_feats,
-        **audio_feats
-    }
-    return row 
+
+    out[FEATURE_INDEX["mfcc_9_mean"]] = mfcc_mean[9]
+    out[FEATURE_INDEX["mfcc_7_mean"]] = mfcc_mean[7]
+    out[FEATURE_INDEX["zcr"]] = librosa.feature.zero_crossing_rate(y=signal).mean()
+    out[FEATURE_INDEX["band0_300"]] = band0_300
+    out[FEATURE_INDEX["numberOfHuman"]] = count_people(img_path)
+    out[FEATURE_INDEX["speech_noise_ratio"]] = band300_3000 / (band0_300 + 1e-7)
+    out[FEATURE_INDEX["mfcc_3_mean"]] = mfcc_mean[3]
+    out[FEATURE_INDEX["mfcc_14_mean"]] = mfcc_mean[14]
+    out[FEATURE_INDEX["mfcc_8_mean"]] = mfcc_mean[8]
+    out[FEATURE_INDEX["centroid"]] = librosa.feature.spectral_centroid(y=signal, sr=sr).mean()
+    out[FEATURE_INDEX["bleNum"]] = ble_raw
+    return out
 
 def predict_crowd(ID, img_path, ble_raw, audio_path):
     """
-    feature_dict 예시:
-    {
-       "mfcc_9_mean": -132.1,
-       "mfcc_7_mean": 22.3,
-       "zcr": 0.01,
-       "band0_300": 47.1,
-       "numberOfHuman": 14,
-       "speech_noise_ratio": 0.22,
-       "mfcc_3_mean": 30.4,
-       "mfcc_14_mean": 4.12,
-       "mfcc_8_mean": -2.11,
-       "centroid": 1750.2,
-       "bleNum": 83
-    }
+    feature row 예시 (top_features 순서):
+    [
+       -132.1,   # mfcc_9_mean
+       22.3,     # mfcc_7_mean
+       0.01,     # zcr
+       47.1,     # band0_300
+       14,       # numberOfHuman
+       0.22,     # speech_noise_ratio
+       30.4,     # mfcc_3_mean
+       4.12,     # mfcc_14_mean
+       -2.11,    # mfcc_8_mean
+       1750.2,   # centroid
+       83        # bleNum
+    ]
     """
-    feature_dict = build_features(img_path, ble_raw, audio_path)
-    row = {f: feature_dict[f] for f in top_features}
+    # 임시 행(float64)에 특징값을 채우고, 전부 계산된 경우에만 공간별 history 링 버퍼(float32)에 기록.
+    # 모델에는 float32로 줄이기 전의 float64 값을 그대로 넣는다 (기존 예측과 동일한 입력)
+    row = build_feature_row(feature_history.scratch_row(), img_path, ble_raw, audio_path)
+    feature_history.append(ID, row, time.time())
 
-    df = pd.DataFrame([row])
+    df = pd.DataFrame(row[np.newaxis, :], columns=top_features)
     pred = model.predict(df)[0]            # class 0/1/2
     prob = model.predict_proba(df)[0]      # softmax 확률
 
@@ -306,6 +368,13 @@ class AiPredictCountResponse(BaseModel):
     spaceId: int
     predictCount: int
 
+# 2-1. 공간별 최근 특징 기록 조회 API Response (AI -> BE)
+class FeatureHistoryResponse(BaseModel):
+    spaceId: int
+    columns: List[str]
+    timestamps: List[float]
+    rows: List[List[float]]
+
 # 2-2. AI모델2 호출 API Request (BE -> AI) - List 내부 객체
 class CandidateRoom(BaseModel):
     spaceId: int
@@ -367,12 +436,31 @@ GEMINI_SCHEMA: Dict[str, Any] = {
 }
 
 
-def _call_gemini(
-    user_text: str,
-    spaces: List[Dict[str, Any]],
-    top_n: int,
-) -> Dict[str, Any]:
-    """Gemini API 호출"""
+# 배치 호출용 스키마: 입력 userText마다 GEMINI_SCHEMA와 같은 결과를 하나씩 반환
+GEMINI_BATCH_SCHEMA: Dict[str, Any] = {
+    "type": "OBJECT",
+    "properties": {
+        "results": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "index": {
+                        "type": "INTEGER",
+                        "description": "user_texts 배열에서의 입력 인덱스",
+                    },
+                    **GEMINI_SCHEMA["properties"],
+                },
+                "required": ["index", *GEMINI_SCHEMA["required"]],
+            },
+        },
+    },
+    "required": ["results"],
+}
+
+
+def _spaces_json(spaces: List[Dict[str, Any]]) -> str:
+    """LLM에 넘길 공간 목록(JSON 문자열) 생성"""
     spaces_for_llm = [
         {
             "spaceId": s["space_id"],
@@ -385,7 +473,16 @@ def _call_gemini(
         }
         for s in spaces
     ]
-    spaces_json = json.dumps(spaces_for_llm, ensure_ascii=False)
+    return json.dumps(spaces_for_llm, ensure_ascii=False)
+
+
+def _call_gemini(
+    user_text: str,
+    spaces: List[Dict[str, Any]],
+    top_n: int,
+) -> Dict[str, Any]:
+    """Gemini API 호출"""
+    spaces_json = _spaces_json(spaces)
 
     prompt = f"""
 너는 캠퍼스 공간 추천 모델이다.
@@ -425,6 +522,87 @@ user_text:
     return json.loads(resp.text)
 
 
+def _call_gemini_batch(
+    user_texts: List[str],
+    spaces: List[Dict[str, Any]],
+    top_n: int,
+) -> List[Optional[Dict[str, Any]]]:
+    """
+    여러 userText를 한 번의 Gemini API 호출로 처리 (입력 순서대로 결과 반환).
+    결과에서 빠졌거나 중복된 index의 자리는 None.
+    """
+    spaces_json = _spaces_json(spaces)
+    user_texts_json = json.dumps(
+        [{"index": i, "user_text": t} for i, t in enumerate(user_texts)],
+        ensure_ascii=False,
+    )
+
+    prompt = f"""
+너는 캠퍼스 공간 추천 모델이다.
+
+- spaces: 각 공간은 spaceId와 vector를 가진다.
+  vector는 ["조용한", "대화하는", "공부하는", "휴식하는"] 순서의 점수이다.
+- user_texts: index와 user_text(한국어 문장)를 가진 배열.
+
+user_texts의 각 항목마다 서로 독립적으로 아래 과정을 수행한다.
+
+1. user_text를 분석해서 위 4차원에 대한 intent_vector를 마음속으로 만든다.
+2. 각 공간의 vector와 intent_vector 사이의 코사인 유사도를 계산해서 purposeScore로 사용한다.
+3. purposeScore를 기준으로 내림차순 정렬하여 상위 {top_n}개 공간만
+   topSpaces 배열에 넣는다.
+   각 항목은 {{ "spaceId", "purposeScore" }} 만 포함해야 한다.
+4. user_text 안에 실제 장소명이 언급되었는지 보고,
+   - 언급되면 placeFlag = 1, placeName 에 대표 장소명을 문자열로 넣는다.
+   - 아니면 placeFlag = 0, placeName = "".
+5. 결과의 index에는 입력 항목의 index를 그대로 넣는다.
+
+! results 배열에는 user_texts의 모든 항목에 대한 결과가 정확히 하나씩 있어야 한다.
+! 위도/경도(lat/lng)는 절대 생성하지 마라.
+! 출력은 내가 제공한 GEMINI_BATCH_SCHEMA에 정확히 맞는 순수 JSON만 포함한다.
+   자연어 설명은 포함하지 않는다.
+
+spaces(JSON):
+{spaces_json}
+
+user_texts(JSON):
+{user_texts_json}
+"""
+
+    resp = client.models.generate_content(
+        model="gemini-2.5-flash",
+        contents=prompt,
+        config=types.GenerateContentConfig(
+            response_mime_type="application/json",
+            response_schema=GEMINI_BATCH_SCHEMA,
+        ),
+    )
+
+    results: List[Optional[Dict[str, Any]]] = [None for _ in user_texts]
+    seen = set()
+    duplicated = set()
+    for item in json.loads(resp.text).get("results", []):
+        index = item.get("index")
+        if not isinstance(index, int) or not 0 <= index < len(user_texts):
+            continue
+        if index in seen:
+            # 같은 index가 여러 번 오면 어느 쪽이 맞는지 알 수 없으므로 버린다
+            duplicated.add(index)
+        seen.add(index)
+        results[index] = item
+
+    for index in duplicated:
+        results[index] = None
+    return results
+
+
+def _to_purpose_score_map(gemini_res: Dict[str, Any]) -> Dict[int, float]:
+    """Gemini 결과에서 spaceId: purposeScore 맵 생성"""
+    purpose_score_map = {}
+    for item in gemini_res.get("topSpaces", []):
+        purpose_score_map[item["spaceId"]] = item["purposeScore"]
+    return purpose_score_map
+
+
 def run_nlp_model(
     user_text: str,
     spaces: List[Dict[str, Any]],
@@ -433,17 +611,130 @@ def run_nlp_model(
     # spaces의 길이만큼 top_n 설정하여 모든 공간에 대해 점수를 계산하도록 요청
     gemini_res = _call_gemini(user_text, spaces, len(spaces))
 
-    # spaceId: purposeScore 맵 생성
-    purpose_score_map = {}
-    for item in gemini_res.get("topSpaces", []):
-        purpose_score_map[item["spaceId"]] = item["purposeScore"]
+    return _to_purpose_score_map(gemini_res)
 
-    return purpose_score_map
+
+# ═══════════════════════════════════════════════════════
+# Gemini 요청 배치 처리 (GEMINI_BATCH_WINDOW_MS > 0 일 때만 사용)
+# ═══════════════════════════════════════════════════════
+
+# 배치 윈도우 동안 모인 userText -> 결과를 기다리는 Future
+_pending_nlp: Dict[str, "asyncio.Future[Dict[int, float]]"] = {}
+_pending_nlp_spaces: List[Dict[str, Any]] = []
+_pending_nlp_flush: Optional[asyncio.TimerHandle] = None
+# 실행 중인 배치 태스크 (GC로 중간에 사라지지 않도록 끝날 때까지 참조 유지)
+_nlp_batch_tasks: Set["asyncio.Task[None]"] = set()
+
+
+def _flush_nlp_batch() -> None:
+    """대기 중인 userText들을 하나의 배치로 떼어내 Gemini 호출 태스크를 띄운다"""
+    global _pending_nlp, _pending_nlp_flush
+
+    if _pending_nlp_flush is not None:
+        _pending_nlp_flush.cancel()
+        _pending_nlp_flush = None
+
+    batch, _pending_nlp = _pending_nlp, {}
+    if batch:
+        task = asyncio.get_running_loop().create_task(
+            _run_nlp_batch(batch, _pending_nlp_spaces)
+        )
+        _nlp_batch_tasks.add(task)
+        task.add_done_callback(_nlp_batch_tasks.discard)
+
+
+async def _run_nlp_batch(
+    batch: Dict[str, "asyncio.Future[Dict[int, float]]"],
+    spaces: List[Dict[str, Any]],
+) -> None:
+    """배치 Gemini 호출 후 purposeScore 맵을 각 요청의 Future로 나눠준다"""
+    user_texts = list(batch.keys())
+    try:
+        try:
+            if len(user_texts) == 1:
+                results = [
+                    await asyncio.to_thread(_call_gemini, user_texts[0], spaces, len(spaces))
+                ]
+            else:
+                results = await asyncio.to_thread(
+                    _call_gemini_batch, user_texts, spaces, len(spaces)
+                )
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        # 배치 결과에서 빠진 userText는 빈 점수로 넘기지 않고 단건 호출로 다시 계산
+        missing = [i for i, gemini_res in enumerate(results) if gemini_res is None]
+        if missing:
+            retried = await asyncio.gather(
+                *(
+                    asyncio.to_thread(_call_gemini, user_texts[i], spaces, len(spaces))
+                    for i in missing
+                ),
+                return_exceptions=True,
+            )
+            for i, gemini_res in zip(missing, retried):
+                results[i] = gemini_res
+
+        for user_text, gemini_res in zip(user_texts, results):
+            future = batch[user_text]
+            if future.done():
+                continue
+            if isinstance(gemini_res, Exception):
+                future.set_exception(gemini_res)
+                continue
+            try:
+                purpose_score_map = _to_purpose_score_map(gemini_res)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            future.set_result(purpose_score_map)
+    finally:
+        # 취소되거나 예상 못한 오류로 끝나도 기다리는 요청이 영원히 멈추지 않도록 정리
+        for future in batch.values():
+            if not future.done():
+                future.set_exception(RuntimeError("Gemini 배치 처리가 결과 없이 종료되었습니다"))
+
+
+async def run_nlp_model_batched(
+    user_text: str,
+    spaces: List[Dict[str, Any]],
+) -> Dict[int, float]:
+    """
+    run_nlp_model의 배치 버전.
+    GEMINI_BATCH_WINDOW_MS 동안 들어온 서로 다른 userText를 모아 한 번에 Gemini로 보내고,
+    같은 userText로 들어온 요청들은 하나의 결과를 함께 받는다.
+    """
+    global _pending_nlp_spaces, _pending_nlp_flush
+
+    loop = asyncio.get_running_loop()
+
+    future = _pending_nlp.get(user_text)
+    if future is None:
+        if not _pending_nlp:
+            _pending_nlp_spaces = spaces
+            _pending_nlp_flush = loop.call_later(
+                GEMINI_BATCH_WINDOW_MS / 1000.0, _flush_nlp_batch
+            )
+        future = loop.create_future()
+        _pending_nlp[user_text] = future
+
+        if len(_pending_nlp) >= GEMINI_BATCH_MAX_SIZE:
+            _flush_nlp_batch()
+
+    # 같은 Future를 여러 요청이 공유하므로, 한 요청이 취소돼도 나머지에 영향이 없도록 shield
+    purpose_score_map = await asyncio.shield(future)
+    return dict(purpose_score_map)
 
 # ═══════════════════════════════════════════════════════
 # API 엔드포인트
 # ═══════════════════════════════════════════════════════
 
+# userId -> 마지막 추천 랭킹 상태 (새로고침 시 증분 재정렬용)
+_ranking_sessions: "OrderedDict[int, RankingSession]" = OrderedDict()
+
 # 2-1. AI모델1 호출 API (인원수 계산)
 @app.post("/ai/predict/count", response_model=AiPredictCountResponse)
 async def predict_count_endpoint(request: AiPredictCountRequest):
@@ -460,6 +751,21 @@ async def predict_count_endpoint(request: AiPredictCountRequest):
         predictCount=int(result)
     )
 
+# 2-1. 공간별 최근 특징 기록 조회 API
+@app.get("/ai/history/features", response_model=FeatureHistoryResponse)
+async def feature_history_endpoint(spaceId: int, limit: int = 60):
+    """
+    spaceId의 최근 특징 행(top_features 순서)을 오래된 순으로 최대 limit개 반환
+    """
+    timestamps, rows = feature_history.window(spaceId, limit)
+
+    return FeatureHistoryResponse(
+        spaceId=spaceId,
+        columns=feature_history.columns,
+        timestamps=timestamps.tolist(),
+        rows=rows.tolist(),
+    )
+
 # 2-2. AI모델2 호출 API (최종 추천 점수 계산)
 @app.post("/api/v1/recommendation", response_model=AiRecommendationResponse)
 async def recommend_endpoint(request: AiRecommendationRequest):
@@ -470,24 +776,41 @@ async def recommend_endpoint(request: AiRecommendationRequest):
         raise HTTPException(status_code=500, detail="Gemini API 키가 설정되지 않았습니다")
 
     try:
-        # 1. NLP 모델 실행: userText를 기반으로 모든 공간의 목적 점수를 계산
-        purpose_score_map = run_nlp_model(request.userText, ALL_SPACE_DATA)
-
-        # 2. BE에서 받은 후보 목록에 NLP 점수를 덮어쓰기 (Overwrite)
-        candidate_rooms_dicts = []
-        for room in request.candidateRooms:
-            # Pydantic 모델을 딕셔너리로 변환
-            room_dict = room.dict()
-            space_id = room_dict["spaceId"]
-
-            # NLP에서 계산된 목적 점수로 덮어쓰기
-            calculated_purpose_score = purpose_score_map.get(space_id, 0.0)
-            room_dict["purposeScore"] = calculated_purpose_score
-
-            candidate_rooms_dicts.append(room_dict)
-
-        # 3. 추천 모델(reco.py) 호출
-        results = recommend_rooms(candidate_rooms_dicts)
+        # Pydantic 모델을 딕셔너리로 변환
+        candidate_rooms_dicts = [room.dict() for room in request.candidateRooms]
+
+        # 0. 같은 사용자가 같은 목적·위치로 다시 요청한 경우(새로고침),
+        #    NLP 호출 없이 인원수가 바뀐 공간만 다시 계산해서 순서를 고친다
+        session = _ranking_sessions.get(request.userId)
+        if session is not None and session.matches(request.userText, candidate_rooms_dicts):
+            _ranking_sessions.move_to_end(request.userId)
+            session.update_counts(candidate_rooms_dicts)
+            results = session.results()
+        else:
+            # 1. NLP 모델 실행: userText를 기반으로 모든 공간의 목적 점수를 계산
+            if GEMINI_BATCH_WINDOW_MS > 0:
+                purpose_score_map = await run_nlp_model_batched(request.userText, ALL_SPACE_DATA)
+            else:
+                purpose_score_map = run_nlp_model(request.userText, ALL_SPACE_DATA)
+
+            # 2. BE에서 받은 후보 목록에 NLP 점수를 덮어쓰기 (Overwrite)
+            for room_dict in candidate_rooms_dicts:
+                # NLP에서 계산된 목적 점수로 덮어쓰기
+                room_dict["purposeScore"] = purpose_score_map.get(room_dict["spaceId"], 0.0)
+
+            # 3. 추천 모델(reco.py) 호출 후 다음 요청을 위해 랭킹 세션 저장
+            space_ids = [room_dict["spaceId"] for room_dict in candidate_rooms_dicts]
+            if len(set(space_ids)) == len(space_ids):
+                session = RankingSession(request.userText, candidate_rooms_dicts)
+                _ranking_sessions[request.userId] = session
+                _ranking_sessions.move_to_end(request.userId)
+                while len(_ranking_sessions) > RANKING_SESSION_MAX:
+                    _ranking_sessions.popitem(last=False)
+                results = session.results()
+            else:
+                # spaceId가 중복된 요청은 세션으로 관리할 수 없으므로 매번 전체 계산
+                _ranking_sessions.pop(request.userId, None)
+                results = recommend_rooms(candidate_rooms_dicts)
 
         # 4. AiRecommendationResponse DTO에 맞게 결과 변환
         data = [
@@ -1,6 +1,8 @@
 # reco.py
 # 공간 추천 점수 계산 모델 (AI 모델 2)
 
+from bisect import bisect_left, insort
+
 def calc_congestion_score(people, capacity):
     """혼잡도 계산 (한산할수록 점수↑)"""
     if capacity <= 0:
@@ -38,31 +40,114 @@ def recommend_rooms(candidate_rooms):
         "capacity": 40
       }
     """
-    results = []
-
-    for c in candidate_rooms:
-        space_id = c["spaceId"]
-        space_name = c.get("spaceName", "")
-
-        purpose_score = float(c.get("purposeScore", 0.0))
-        distance_score = float(c.get("distanceFeature", 0.5))
-        people = int(c.get("predictCount", 0))
-        capacity = int(c.get("capacity", 1))
-
-        congestion_score = calc_congestion_score(people, capacity)
-        final_score = calc_final_score(purpose_score, congestion_score, distance_score)
-
-        results.append({
-            "spaceId": space_id,
-            "spaceName": space_name,
-            "purposeScore": purpose_score,
-            "people": people,
-            "capacity": capacity,
-            "congestionScore": congestion_score,
-            "distanceScore": distance_score,
-            "finalScore": final_score,
-            "finalRecommendScore": final_score
-        })
+    results = [score_room(c) for c in candidate_rooms]
 
     results.sort(key=lambda x: x["finalScore"], reverse=True)
-    return results
\ No newline at end of file
+    return results
+
+
+def score_room(c):
+    """후보 공간 하나의 점수 계산 (recommend_rooms 결과 원소와 같은 형태)"""
+    space_id = c["spaceId"]
+    space_name = c.get("spaceName", "")
+
+    purpose_score = float(c.get("purposeScore", 0.0))
+    distance_score = float(c.get("distanceFeature", 0.5))
+    people = int(c.get("predictCount", 0))
+    capacity = int(c.get("capacity", 1))
+
+    congestion_score = calc_congestion_score(people, capacity)
+    final_score = calc_final_score(purpose_score, congestion_score, distance_score)
+
+    return {
+        "spaceId": space_id,
+        "spaceName": space_name,
+        "purposeScore": purpose_score,
+        "people": people,
+        "capacity": capacity,
+        "congestionScore": congestion_score,
+        "distanceScore": distance_score,
+        "finalScore": final_score,
+        "finalRecommendScore": final_score
+    }
+
+
+class RankingSession:
+    """
+    같은 사용자의 연속 추천 요청(새로고침)을 위한 랭킹 상태.
+
+    purposeScore / distanceScore는 고정해두고, predictCount가 바뀐 공간만
+    혼잡도·최종 점수를 다시 계산해서 정렬된 키 목록에서 위치만 고친다.
+    (공간 하나 갱신 = bisect로 찾아 빼고 다시 끼워넣기)
+
+    비용: 위치 탐색은 O(log n)이지만 list에서 빼고 끼우는 데 O(n)이 들어
+    바뀐 공간마다 O(n), matches()/results()도 요청마다 O(n)이다.
+    공간 수가 적어(현재 9개) 전체 재정렬보다 나은 건 점수 재계산과 NLP 호출을 건너뛰는 부분이다.
+
+    candidate_rooms의 spaceId는 서로 달라야 한다 (중복이면 ValueError).
+    """
+
+    def __init__(self, user_text, candidate_rooms):
+        self.user_text = user_text
+        self._space_ids = [c["spaceId"] for c in candidate_rooms]  # 입력 순서
+        self._rooms = {}    # spaceId -> score_room 결과
+        self._index = {}    # spaceId -> 입력 순서 (동점일 때 recommend_rooms와 같은 순서 유지)
+        self._keys = []     # (-finalScore, 입력 순서, spaceId) 오름차순
+
+        if len(set(self._space_ids)) != len(self._space_ids):
+            raise ValueError("candidate_rooms has duplicate spaceId")
+
+        for i, c in enumerate(candidate_rooms):
+            room = score_room(c)
+            self._rooms[room["spaceId"]] = room
+            self._index[room["spaceId"]] = i
+            self._keys.append(self._key(room))
+        self._keys.sort()
+
+    def _key(self, room):
+        space_id = room["spaceId"]
+        return (-room["finalScore"], self._index[space_id], space_id)
+
+    def matches(self, user_text, candidate_rooms):
+        """
+        목적 텍스트·후보 공간(순서 포함)·거리·수용 인원이 그대로인지 (predictCount만 달라도 됨).
+        순서가 바뀌면 동점 처리 순서가 달라지므로 다른 요청으로 본다.
+        """
+        if user_text != self.user_text or len(candidate_rooms) != len(self._space_ids):
+            return False
+
+        for space_id, c in zip(self._space_ids, candidate_rooms):
+            if c["spaceId"] != space_id:
+                return False
+            room = self._rooms[space_id]
+            if float(c.get("distanceFeature", 0.5)) != room["distanceScore"]:
+                return False
+            if int(c.get("capacity", 1)) != room["capacity"]:
+                return False
+        return True
+
+    def update_counts(self, candidate_rooms):
+        """predictCount가 바뀐 공간만 점수를 다시 계산하고 순서를 고친다"""
+        for c in candidate_rooms:
+            room = self._rooms[c["spaceId"]]
+            people = int(c.get("predictCount", 0))
+            if people == room["people"]:
+                continue
+
+            old_key = self._key(room)
+            del self._keys[bisect_left(self._keys, old_key)]
+
+            congestion_score = calc_congestion_score(people, room["capacity"])
+            final_score = calc_final_score(
+                room["purposeScore"], congestion_score, room["distanceScore"]
+            )
+            room["people"] = people
+            room["congestionScore"] = congestion_score
+            room["finalScore"] = final_score
+            room["finalRecommendScore"] = final_score
+
+            insort(self._keys, self._key(room))
+
+    def results(self):
+        """현재 순서대로 정렬된 추천 결과 (recommend_rooms와 같은 형태)"""
+        return [self._rooms[space_id] for _, _, space_id in self._keys]
\ No newline at end of file